@@ -0,0 +1,20 @@
+"""Process-wide Composio SDK client shared by the webhook apps."""
+
+from __future__ import annotations
+
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from composio import Composio
+from composio_langchain import LangchainProvider
+
+load_dotenv()
+
+
+@lru_cache(maxsize=1)
+def get_composio() -> Composio:
+    """Return the shared Composio client, creating it on first use."""
+    return Composio(provider=LangchainProvider())
+
+
+__all__ = ["get_composio"]
@@ -1,19 +1,36 @@
 """Facebook Messenger webhook handler that routes messages to DeepAgent and replies via Composio."""
 
 from __future__ import annotations
+import asyncio
 import json
-from collections import deque
+from collections import OrderedDict
+import functools
 import logging
 import os
+import random
+import re
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.responses import JSONResponse, PlainTextResponse
-from composio import Composio
-from composio_langchain import LangchainProvider
-from rag_chat_helpers import get_rag_chat_response
+from composio_singleton import get_composio
+from rag_chat_helpers import close_rag_client, get_rag_chat_response
+from task_helpers import seen_in_redis, spawn
 import httpx
+import orjson
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - optional dependency
+    redis_asyncio = None  # type: ignore
+
+try:
+    import h2  # noqa: F401 - lets httpx negotiate HTTP/2
+except ImportError:  # pragma: no cover - optional dependency
+    h2 = None
 
 load_dotenv()
 
@@ -35,10 +52,39 @@ FACEBOOK_CONNECTED_ACCOUNT_ID = os.getenv("FACEBOOK_CONNECTED_ACCOUNT_ID", "")
 # Get this from: Facebook Developer Dashboard → Your App → Messenger → Settings → Access Tokens
 FACEBOOK_PAGE_ACCESS_TOKEN = os.getenv("FACEBOOK_PAGE_ACCESS_TOKEN", "")
 
-_processed_message_ids: deque[str] = deque()
-_processed_message_index: set[str] = set()
+# Outbound send pacing. Meta reports quota usage (in percent) via the X-App-Usage and
+# X-Business-Use-Case-Usage headers; only back off when it gets high.
+_USAGE_THROTTLE_PERCENT = 75
+_THROTTLED_SEND_DELAY_SECONDS = 0.5
+_MIN_SEND_INTERVAL_SECONDS = 0.2
+# Monotonic time of the next free send slot; senders reserve slots instead of polling
+_next_send_at: float = 0.0
+
+# Graph API responses worth retrying (throttling and transient server errors)
+_GRAPH_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_graph_api_usage_percent: int = 0
+
+# Sentence boundaries used when splitting long replies; punctuation stays with its sentence
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])(\s+)")
+# Instagram rejects DMs longer than 1000 characters
+_MAX_IG_DM_LEN = 1000
+
+# Upper bound on outbound sends in flight across all conversations
+_SEND_CONCURRENCY = 3
+_send_semaphore = asyncio.Semaphore(_SEND_CONCURRENCY)
+
+# Message dedupe: a bounded in-process LRU, plus Redis (when REDIS_URL is set) so
+# retries landing on different workers are also caught
+_DEDUP_MAX_IDS = 10_000
+_DEDUP_TTL_SECONDS = 300
+_processed_message_ids: OrderedDict[str, None] = OrderedDict()
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+_redis = redis_asyncio.Redis.from_url(REDIS_URL) if redis_asyncio and REDIS_URL else None
 
 FACEBOOK_ACCOUNTS_PATH = Path("facebook_accounts.json")
+# Instagram Business Account ID -> Composio Instagram account, as written by sync_instagram_accounts
+INSTAGRAM_ACCOUNTS_PATH = Path(os.getenv("INSTAGRAM_ACCOUNTS_PATH", "instagram_accounts.json"))
 DEFAULT_RESPONSE_TEXT = os.getenv(
     "FACEBOOK_DEFAULT_RESPONSE",
     "Hi! I'm still connecting. Please try again later.",
@@ -50,18 +96,57 @@ def load_facebook_mapping() -> dict[str, Any]:
     if not FACEBOOK_ACCOUNTS_PATH.exists():
         return {}
     try:
-        with FACEBOOK_ACCOUNTS_PATH.open("r", encoding="utf-8") as fh:
-            return json.load(fh)
-    except (json.JSONDecodeError, Exception) as e:
+        return orjson.loads(FACEBOOK_ACCOUNTS_PATH.read_bytes())
+    except (orjson.JSONDecodeError, Exception) as e:
         logger.error("Failed to load facebook_accounts.json: %s", e)
         return {}
 
 
+def load_instagram_mapping() -> dict[str, Any]:
+    """Load Instagram Business Account ID to Composio Instagram account mapping (optional)."""
+    if not INSTAGRAM_ACCOUNTS_PATH.exists():
+        return {}
+    try:
+        return orjson.loads(INSTAGRAM_ACCOUNTS_PATH.read_bytes())
+    except (orjson.JSONDecodeError, Exception) as e:
+        logger.error("Failed to load instagram_accounts.json: %s", e)
+        return {}
+
+
 facebook_account_map = load_facebook_mapping()
+instagram_account_map = load_instagram_mapping()
+
+# Pooled Graph API client so direct sends reuse the TLS connection; Graph API speaks
+# HTTP/2, so concurrent sends multiplex over it when h2 is installed
+_graph_client = httpx.AsyncClient(
+    base_url="https://graph.facebook.com/v18.0",
+    timeout=10.0,
+    http2=h2 is not None,
+    # Sends are capped by _send_semaphore, so a handful of warm connections is plenty
+    limits=httpx.Limits(max_connections=10, max_keepalive_connections=4, keepalive_expiry=30.0),
+)
+
+async def _warm_graph_client() -> None:
+    """Open the pooled Graph API connection up front so the first reply skips the TLS handshake."""
+    try:
+        await _graph_client.get("/", timeout=2.0)
+    except httpx.HTTPError as e:
+        logger.debug("Graph API warm-up failed: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the Graph API connection on startup and close pooled HTTP clients on shutdown."""
+    if FACEBOOK_PAGE_ACCESS_TOKEN:
+        await _warm_graph_client()
+    yield
+    await _graph_client.aclose()
+    if _redis is not None:
+        await _redis.aclose()
+    await close_rag_client()
 
-composio_client = Composio(provider=LangchainProvider())
 
-app = FastAPI(title="Composio Facebook Messenger Bridge")
+app = FastAPI(title="Composio Facebook Messenger Bridge", lifespan=lifespan)
 
 
 @app.get("/")
@@ -77,22 +162,81 @@ async def root():
     }
 
 
-def _is_duplicate(message_id: str) -> bool:
+async def _is_duplicate(message_id: str) -> bool:
     """Check if message ID was already processed."""
-    if message_id in _processed_message_index:
+    if message_id in _processed_message_ids:
+        _processed_message_ids.move_to_end(message_id)
         return True
-    _processed_message_ids.append(message_id)
-    _processed_message_index.add(message_id)
-    while len(_processed_message_ids) > 500:
-        old = _processed_message_ids.popleft()
-        _processed_message_index.discard(old)
-    return False
+    _processed_message_ids[message_id] = None
+    if len(_processed_message_ids) > _DEDUP_MAX_IDS:
+        _processed_message_ids.popitem(last=False)
+
+    return await seen_in_redis(_redis, f"fb:msg:{message_id}", _DEDUP_TTL_SECONDS)
+
+
+def _record_graph_api_usage(headers: httpx.Headers) -> None:
+    """Remember the highest quota usage percentage reported by the Graph API."""
+    global _graph_api_usage_percent
+    usage = 0
+    try:
+        app_usage = headers.get("x-app-usage")
+        if app_usage:
+            usage = max(usage, int(json.loads(app_usage).get("call_count", 0)))
+        business_usage = headers.get("x-business-use-case-usage")
+        if business_usage:
+            for entries in json.loads(business_usage).values():
+                for entry in entries:
+                    usage = max(usage, int(entry.get("call_count", 0)))
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.debug("Could not parse Graph API usage headers: %s", e)
+        return
+    _graph_api_usage_percent = usage
+
+
+async def _pace_send() -> None:
+    """Reserve the next send slot and wait for it; only sleeps when sends are bunched up."""
+    global _next_send_at
+    if _graph_api_usage_percent >= _USAGE_THROTTLE_PERCENT:
+        interval = _THROTTLED_SEND_DELAY_SECONDS
+    else:
+        interval = _MIN_SEND_INTERVAL_SECONDS
+    now = time.monotonic()
+    slot = max(now, _next_send_at)
+    _next_send_at = slot + interval
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
+
+def _split_long_sentence(sentence: str, max_length: int) -> list[str]:
+    """Break a single over-long sentence at newlines, hard-splitting any line that still won't fit."""
+    if len(sentence) <= max_length:
+        return [sentence]
+
+    pieces: list[str] = []
+    current = ""
+    for line in sentence.split("\n"):
+        while len(line) > max_length:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_length])
+            line = line[max_length:]
+        if current and len(current) + 1 + len(line) <= max_length:
+            current += "\n" + line
+        else:
+            if current:
+                pieces.append(current)
+            current = line
+    if current:
+        pieces.append(current)
+    return pieces
 
 
 def split_message_for_social_media(text: str, max_length: int = 1900) -> list[str]:
     """
     Split a long message into chunks that fit Facebook/Instagram's 2000 character limit.
-    Tries to split at sentence boundaries when possible.
+    Greedily packs whole sentences into each chunk; a sentence that is too long on its
+    own is split at newlines, then hard-split.
     
     Args:
         text: The message text to split
@@ -104,60 +248,28 @@ def split_message_for_social_media(text: str, max_length: int = 1900) -> list[st
     if len(text) <= max_length:
         return [text]
     
-    chunks = []
-    current_chunk = ""
+    chunks: list[str] = []
+    current = ""
+    separator = ""
     
-    # Try to split by sentences first
-    sentences = text.split('. ')
-    
-    for sentence in sentences:
-        # If adding this sentence would exceed limit, save current chunk and start new
-        if current_chunk and len(current_chunk) + len(sentence) + 2 > max_length:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence
-        else:
-            if current_chunk:
-                current_chunk += ". " + sentence
+    # The capture group makes re.split alternate: sentence, separator, sentence, ...
+    for index, part in enumerate(_SENTENCE_SPLIT.split(text)):
+        if index % 2:
+            separator = part
+            continue
+        for piece in _split_long_sentence(part, max_length):
+            if current and len(current) + len(separator) + len(piece) <= max_length:
+                current += separator + piece
             else:
-                current_chunk = sentence
+                if current.strip():
+                    chunks.append(current.strip())
+                current = piece
+            separator = "\n"
     
-    # Add the last chunk
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    if current.strip():
+        chunks.append(current.strip())
     
-    # If any chunk is still too long, split by newlines
-    final_chunks = []
-    for chunk in chunks:
-        if len(chunk) <= max_length:
-            final_chunks.append(chunk)
-        else:
-            # Split by newlines
-            lines = chunk.split('\n')
-            temp_chunk = ""
-            for line in lines:
-                if len(temp_chunk) + len(line) + 1 > max_length:
-                    if temp_chunk:
-                        final_chunks.append(temp_chunk.strip())
-                    temp_chunk = line
-                else:
-                    if temp_chunk:
-                        temp_chunk += "\n" + line
-                    else:
-                        temp_chunk = line
-            if temp_chunk:
-                final_chunks.append(temp_chunk.strip())
-    
-    # Final fallback: if still too long, hard split
-    really_final_chunks = []
-    for chunk in final_chunks:
-        if len(chunk) <= max_length:
-            really_final_chunks.append(chunk)
-        else:
-            # Hard split at max_length
-            for i in range(0, len(chunk), max_length):
-                really_final_chunks.append(chunk[i:i + max_length])
-    
-    return really_final_chunks
+    return chunks
 
 
 def send_facebook_message(
@@ -175,7 +287,7 @@ def send_facebook_message(
         "message_text": text,  # Fixed: was "message"
     }
 
-    return composio_client.tools.execute(
+    return get_composio().tools.execute(
         slug="FACEBOOK_SEND_MESSAGE",
         arguments=arguments,
         user_id=org_id,
@@ -185,7 +297,40 @@ def send_facebook_message(
     )
 
 
-def send_instagram_message_direct(
+async def _graph_post(
+    path: str,
+    data: dict[str, Any],
+    max_retries: int = 3,
+    base: float = 1.0,
+    cap: float = 30.0,
+    jitter: float = 0.5,
+) -> httpx.Response:
+    """
+    POST to the Graph API, retrying throttling/5xx responses and failed connects
+    with capped, jittered exponential backoff. Auth and other 4xx errors return at once.
+    Each attempt holds a _send_semaphore slot; backoff sleeps do not.
+    """
+    for attempt in range(max_retries):
+        try:
+            async with _send_semaphore:
+                response = await _graph_client.post(path, data=data)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            pass  # Nothing reached Meta, so retrying cannot double-send
+        else:
+            _record_graph_api_usage(response.headers)
+            if response.status_code not in _GRAPH_RETRY_STATUSES:
+                return response
+        delay = min(cap, base * 2 ** attempt) * (1 + random.random() * jitter)
+        logger.warning("Graph API POST %s failed (attempt %d); retrying in %.1fs", path, attempt + 1, delay)
+        await asyncio.sleep(delay)
+
+    async with _send_semaphore:
+        response = await _graph_client.post(path, data=data)
+    _record_graph_api_usage(response.headers)
+    return response
+
+
+async def send_instagram_message_direct(
     *,
     instagram_account_id: str,
     recipient_id: str,
@@ -203,7 +348,7 @@ def send_instagram_message_direct(
         access_token: Facebook Page Access Token (if not provided, uses FACEBOOK_PAGE_ACCESS_TOKEN env var)
     
     Returns:
-        dict with response from Facebook Graph API
+        dict with response from Facebook Graph API (plus the HTTP status_code on errors)
     """
     if not access_token:
         access_token = FACEBOOK_PAGE_ACCESS_TOKEN
@@ -215,10 +360,6 @@ def send_instagram_message_direct(
             "Get it from: Facebook Developer Dashboard → Your App → Messenger → Settings → Access Tokens"
         )
     
-    # Facebook Graph API endpoint for Instagram messages
-    # Try v18.0 first, fallback to latest if needed
-    url = f"https://graph.facebook.com/v18.0/{instagram_account_id}/messages"
-    
     # Request payload - Instagram messaging format
     payload = {
         "recipient": json.dumps({"id": recipient_id}),
@@ -227,17 +368,17 @@ def send_instagram_message_direct(
     }
     
     try:
-        response = httpx.post(url, data=payload, timeout=10.0)
+        response = await _graph_post(f"/{instagram_account_id}/messages", data=payload)
         response.raise_for_status()
         result = response.json()
-        logger.info(f"Instagram message sent successfully via Graph API: {result}")
+        logger.info("Instagram message sent successfully via Graph API: %s", result)
         return {"data": result, "successful": True, "error": None}
     except httpx.HTTPStatusError as e:
         error_data = e.response.json() if e.response else {}
         error_message = error_data.get("error", {}).get("message", str(error_data))
         error_code = error_data.get("error", {}).get("code", "unknown")
         
-        logger.error(f"Facebook Graph API error: {e.response.status_code} - {error_message}")
+        logger.error("Facebook Graph API error: %s - %s", e.response.status_code, error_message)
         
         # If error is about permissions, provide helpful message
         if error_code == 3 or "capability" in error_message.lower():
@@ -250,32 +391,79 @@ def send_instagram_message_direct(
                 "4. Make sure your app has access to Instagram Business Account"
             )
         
-        return {"data": {}, "successful": False, "error": error_message}
+        return {
+            "data": {},
+            "successful": False,
+            "error": error_message,
+            "status_code": e.response.status_code,
+        }
     except Exception as e:
-        logger.error(f"Failed to send Instagram message via Graph API: {e}")
+        logger.error("Failed to send Instagram message via Graph API: %s", e)
         return {"data": {}, "successful": False, "error": str(e)}
 
 
-def send_instagram_message(
+def resolve_instagram_account(instagram_account_id: str) -> tuple[str, str] | None:
+    """
+    Resolve an Instagram Business Account ID to the org_id and connected_account_id of
+    its Composio Instagram account, or None if instagram_accounts.json has no entry.
+    """
+    entry = instagram_account_map.get(instagram_account_id)
+    if not entry or not entry.get("org_id") or not entry.get("connected_account_id"):
+        return None
+    return entry["org_id"], entry["connected_account_id"]
+
+
+async def send_instagram_message(
     *,
-    org_id: str,
-    connected_account_id: str,
     instagram_account_id: str,
     recipient_id: str,
     text: str,
 ) -> dict[str, Any]:
     """
-    Send Instagram message using direct Facebook Graph API (bypasses Composio).
-    This function uses send_instagram_message_direct() which calls Facebook Graph API directly.
+    Send Instagram message using direct Facebook Graph API, falling back to Composio.
+    The direct call saves the Composio proxy hop. Composio is used when no page access
+    token is configured or the Graph API rejects the request with a 4xx, and only if
+    instagram_accounts.json maps instagram_account_id to a Composio Instagram account.
     """
-    logger.info("Sending Instagram message via direct Facebook Graph API")
-    return send_instagram_message_direct(
-        instagram_account_id=instagram_account_id,
-        recipient_id=recipient_id,
-        text=text,
-    )
-
-
+    result: dict[str, Any] | None = None
+    if FACEBOOK_PAGE_ACCESS_TOKEN:
+        logger.info("Sending Instagram message via direct Facebook Graph API")
+        result = await send_instagram_message_direct(
+            instagram_account_id=instagram_account_id,
+            recipient_id=recipient_id,
+            text=text,
+        )
+        status_code = result.get("status_code")
+        if result.get("successful") or not (status_code and 400 <= status_code < 500):
+            return result
+
+    account = resolve_instagram_account(instagram_account_id)
+    if account is None:
+        if result is not None:
+            return result  # no Instagram Composio account to fall back to
+        return {
+            "data": {},
+            "successful": False,
+            "error": f"No Composio Instagram account for {instagram_account_id} in instagram_accounts.json",
+        }
+    org_id, connected_account_id = account
+    if result is not None:
+        logger.warning("Graph API rejected Instagram message (%s); falling back to Composio", result.get("status_code"))
+
+    logger.info("Sending Instagram message via Composio")
+    async with _send_semaphore:
+        return await asyncio.to_thread(
+            get_composio().tools.execute,
+            slug="INSTAGRAM_SEND_TEXT_MESSAGE",
+            arguments={
+                "ig_user_id": recipient_id,
+                "message": text,
+            },
+            user_id=org_id,
+            connected_account_id=connected_account_id,
+            version="latest",
+            dangerously_skip_version_check=True,
+        )
 
 
 def resolve_page(page_id: str) -> tuple[str, str]:
@@ -355,26 +543,27 @@ async def process_facebook_message(
         # Send reply via Composio (split into chunks if too long)
         try:
             message_chunks = split_message_for_social_media(reply)
-            logger.info(f"Facebook message split into {len(message_chunks)} chunks (total length: {len(reply)} chars)")
+            total = len(message_chunks)
+            logger.info("Facebook message split into %d chunks (total length: %d chars)", total, len(reply))
             
-            for i, chunk in enumerate(message_chunks):
-                logger.info(f"Sending Facebook chunk {i+1}/{len(message_chunks)} ({len(chunk)} chars)")
-                response = send_facebook_message(
-                    org_id=org_id,
-                    connected_account_id=connected_account_id,
-                    page_id=page_id,
-                    recipient_id=sender_id,
-                    text=chunk,
-                )
+            # Everything but the text is the same for every chunk
+            send = functools.partial(
+                send_facebook_message,
+                org_id=org_id,
+                connected_account_id=connected_account_id,
+                page_id=page_id,
+                recipient_id=str(sender_id),
+            )
+            for i, chunk in enumerate(message_chunks, 1):
+                logger.info("Sending Facebook chunk %d/%d (%d chars)", i, total, len(chunk))
+                # Wait out the pacing window before taking a slot, so no slot sits idle
+                await _pace_send()
+                async with _send_semaphore:
+                    response = await asyncio.to_thread(send, text=chunk)
                 if not response.get("successful"):
-                    logger.error(f"Failed to send Facebook chunk {i+1}: {response.get('error')}")
+                    logger.error("Failed to send Facebook chunk %d: %s", i, response.get('error'))
                 else:
-                    logger.info(f"✅ Successfully sent Facebook chunk {i+1}/{len(message_chunks)}")
-                
-                # Small delay between chunks to avoid rate limiting
-                if i < len(message_chunks) - 1:
-                    import asyncio
-                    await asyncio.sleep(0.5)
+                    logger.info("✅ Successfully sent Facebook chunk %d/%d", i, total)
             
             logger.info("✅ Successfully sent all Facebook response chunks")
         except Exception as send_error:
@@ -383,6 +572,62 @@ async def process_facebook_message(
         logger.exception("Error processing Facebook message: %s", e)
 
 
+async def process_instagram_message(
+    instagram_account_id: str,
+    sender_id: str,
+    message_text: str,
+    message_id: str | None,
+) -> None:
+    """Process an Instagram message in the background."""
+    try:
+        # The direct Graph API send needs only the page token; a Composio Instagram
+        # account (looked up by Instagram Business Account ID) is only needed without it
+        if not FACEBOOK_PAGE_ACCESS_TOKEN and resolve_instagram_account(instagram_account_id) is None:
+            logger.error(
+                "Cannot reply to Instagram account %s: FACEBOOK_PAGE_ACCESS_TOKEN is not set "
+                "and instagram_accounts.json has no Composio account for it",
+                instagram_account_id,
+            )
+            return
+
+        # Process message with RAG Super Agent chat API
+        try:
+            logger.info("Dispatching to RAG chat API with text: %s", message_text)
+            reply = await get_rag_chat_response(message_text)
+        except Exception as agent_error:
+            logger.exception("RAG chat API invocation failed: %s", agent_error)
+            reply = f"{DEFAULT_RESPONSE_TEXT}\n\n(Error: {agent_error})"
+
+        # Send reply via Graph API (split into chunks if too long)
+        try:
+            message_chunks = split_message_for_social_media(reply, max_length=_MAX_IG_DM_LEN)
+            total = len(message_chunks)
+            logger.info("Instagram message split into %d chunks (total length: %d chars)", total, len(reply))
+
+            # Everything but the text is the same for every chunk
+            send = functools.partial(
+                send_instagram_message,
+                instagram_account_id=instagram_account_id,
+                recipient_id=str(sender_id),
+            )
+            for i, chunk in enumerate(message_chunks, 1):
+                logger.info("Sending Instagram chunk %d/%d (%d chars)", i, total, len(chunk))
+                # send_instagram_message takes _send_semaphore per attempt itself, so
+                # Graph API backoff never holds a slot other conversations need
+                await _pace_send()
+                response = await send(text=chunk)
+                if not response.get("successful"):
+                    logger.error("Failed to send Instagram chunk %d: %s", i, response.get('error'))
+                else:
+                    logger.info("✅ Successfully sent Instagram chunk %d/%d", i, total)
+
+            logger.info("✅ Successfully sent all Instagram response chunks")
+        except Exception as send_error:
+            logger.exception("Failed to send Instagram message: %s", send_error)
+    except Exception as e:
+        logger.exception("Error processing Instagram message: %s", e)
+
+
 @app.post("/facebook/webhook")
 async def facebook_webhook(request: Request):
     """
@@ -396,19 +641,19 @@ async def facebook_webhook(request: Request):
     try:
         raw_body = await request.body()
         logger.info("Raw body length: %d bytes", len(raw_body))
-        payload = json.loads(raw_body.decode('utf-8'))
-    except json.JSONDecodeError as e:
+        payload = orjson.loads(raw_body)
+    except orjson.JSONDecodeError as e:
         logger.error("Failed to parse JSON: %s", e)
         logger.error("Raw body: %s", raw_body.decode('utf-8', errors='ignore')[:500])
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
-    logger.info("Received Facebook webhook payload: %s", json.dumps(payload, indent=2))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Received Facebook webhook payload: %s", orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode())
 
     # Handle Instagram events (object: "instagram")
     if payload.get("object") == "instagram":
         # Process in background and return immediately
-        import asyncio
-        asyncio.create_task(handle_instagram_webhook(payload))
+        spawn(handle_instagram_webhook(payload))
         return JSONResponse({"ok": True})
     
     # Handle Facebook page events (object: "page")
@@ -427,28 +672,29 @@ async def facebook_webhook(request: Request):
         for event in messaging_events:
             # Skip if it's not a message event
             if "message" not in event:
-                logger.info("Skipping non-message event: %s", event)
+                logger.debug("Skipping non-message event: %s", event)
                 continue
 
             message = event.get("message", {})
+            message_id = message.get("mid")  # Facebook message ID
+
+            # Check for duplicates before doing any other per-event work
+            if message_id and await _is_duplicate(message_id):
+                logger.info("Duplicate message %s detected; ignoring", message_id)
+                continue
+
             sender = event.get("sender", {})
             recipient = event.get("recipient", {})
 
             sender_id = sender.get("id")
             recipient_id = recipient.get("id")
             message_text = message.get("text", "").strip()
-            message_id = message.get("mid")  # Facebook message ID
 
             # Skip if message is empty or from a page (echo)
-            if not message_text or event.get("message", {}).get("is_echo"):
+            if not message_text or message.get("is_echo"):
                 logger.info("Skipping empty or echo message")
                 continue
 
-            # Check for duplicates
-            if message_id and _is_duplicate(message_id):
-                logger.info("Duplicate message %s detected; ignoring", message_id)
-                continue
-
             logger.info(
                 "Received message from %s to page %s: %s",
                 sender_id,
@@ -457,8 +703,7 @@ async def facebook_webhook(request: Request):
             )
 
             # Process message in background (return 200 OK immediately)
-            import asyncio
-            asyncio.create_task(process_facebook_message(
+            spawn(process_facebook_message(
                 page_id=page_id,
                 sender_id=sender_id,
                 message_text=message_text,
@@ -486,28 +731,29 @@ async def handle_instagram_webhook(payload: dict[str, Any]) -> None:
         for event in messaging_events:
             # Skip if it's not a message event
             if "message" not in event:
-                logger.info("Skipping non-message event: %s", event)
+                logger.debug("Skipping non-message event: %s", event)
                 continue
 
             message = event.get("message", {})
+            message_id = message.get("mid")  # Instagram message ID
+
+            # Check for duplicates before doing any other per-event work
+            if message_id and await _is_duplicate(message_id):
+                logger.info("Duplicate message %s detected; ignoring", message_id)
+                continue
+
             sender = event.get("sender", {})
             recipient = event.get("recipient", {})
 
             sender_id = sender.get("id")  # User who sent the message
             recipient_id = recipient.get("id")  # Instagram account ID
             message_text = message.get("text", "").strip()
-            message_id = message.get("mid")  # Instagram message ID
 
             # Skip if message is empty or from a page (echo)
             if not message_text or message.get("is_echo"):
                 logger.info("Skipping empty or echo message")
                 continue
 
-            # Check for duplicates
-            if message_id and _is_duplicate(message_id):
-                logger.info("Duplicate message %s detected; ignoring", message_id)
-                continue
-
             logger.info(
                 "Received Instagram message from %s to account %s: %s",
                 sender_id,
@@ -516,8 +762,7 @@ async def handle_instagram_webhook(payload: dict[str, Any]) -> None:
             )
 
             # Process message in background
-            import asyncio
-            asyncio.create_task(process_instagram_message(
+            spawn(process_instagram_message(
                 instagram_account_id=instagram_account_id,
                 sender_id=sender_id,
                 message_text=message_text,
@@ -3,18 +3,21 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
 import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Coroutine
 
+import httpx
+import orjson
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, Query, HTTPException
+from fastapi import BackgroundTasks, FastAPI, Request, Query, HTTPException
 from fastapi.responses import PlainTextResponse, JSONResponse
-from composio import Composio
 
-from rag_chat_helpers import get_rag_chat_response
+from rag_chat_helpers import close_rag_client, get_rag_chat_response
 
 load_dotenv()
 
@@ -31,36 +34,143 @@ INSTAGRAM_ACCOUNTS_PATH = Path(os.getenv("INSTAGRAM_ACCOUNTS_PATH", "instagram_a
 # Hardcoded message for comments
 COMMENT_REPLY_MESSAGE = "Thank you for commenting!"
 
-# Composio client
-composio_client = Composio(api_key=os.getenv("COMPOSIO_API_KEY"))
+# Pooled async client for Composio's REST API, so tool calls never block the event loop
+COMPOSIO_BASE_URL = os.getenv("COMPOSIO_BASE_URL", "https://backend.composio.dev")
+_COMPOSIO_EXECUTE_PATH = "/api/v3/tools/execute"
+# Instagram toolkit version sent with every execute call. The SDK needed
+# dangerously_skip_version_check=True to run "latest"; the REST API takes it as-is
+INSTAGRAM_TOOLKIT_VERSION = os.getenv("COMPOSIO_INSTAGRAM_TOOLKIT_VERSION", "latest")
+_composio_http = httpx.AsyncClient(
+    base_url=COMPOSIO_BASE_URL,
+    headers={"x-api-key": os.getenv("COMPOSIO_API_KEY", "")},
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+    timeout=30.0,
+)
+
+
+async def _composio_execute(
+    slug: str,
+    arguments: dict[str, Any],
+    user_id: str,
+    connected_account_id: str,
+    version: str,
+) -> dict[str, Any]:
+    """Execute a Composio tool via the REST API; returns the usual data/successful/error dict."""
+    response = await _composio_http.post(
+        f"{_COMPOSIO_EXECUTE_PATH}/{slug}",
+        json={
+            "arguments": arguments,
+            "user_id": user_id,
+            "connected_account_id": connected_account_id,
+            "version": version,
+        },
+    )
+    if response.is_error:
+        return {
+            "data": {},
+            "successful": False,
+            "error": f"Composio returned {response.status_code}: {response.text}",
+        }
+    return response.json()
+
+
+# Upper bound on DMs/comments processed at once (each one calls the RAG API and Composio)
+_PROCESS_CONCURRENCY = 8
+_process_semaphore = asyncio.Semaphore(_PROCESS_CONCURRENCY)
+
+
+async def _bounded(coro: Coroutine[Any, Any, None]) -> None:
+    """Run a coroutine once a _process_semaphore slot is free."""
+    async with _process_semaphore:
+        await coro
+
+
+@dataclass(frozen=True, slots=True)
+class AccountCfg:
+    """Composio credentials for one Instagram Business Account."""
+
+    org_id: str
+    connected_account_id: str
+
 
+# (mtime_ns, mapping) from the last successful parse of INSTAGRAM_ACCOUNTS_PATH
+_ACCOUNTS_CACHE: tuple[int, dict[str, AccountCfg]] | None = None
 
-def load_instagram_account_mapping() -> dict[str, dict[str, str]]:
-    """Load Instagram account mapping from JSON file."""
-    if not INSTAGRAM_ACCOUNTS_PATH.exists():
+
+def load_instagram_account_mapping() -> dict[str, AccountCfg]:
+    """Load Instagram account mapping from JSON file, re-parsing only when it changes."""
+    global _ACCOUNTS_CACHE
+    try:
+        mtime = INSTAGRAM_ACCOUNTS_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
         logger.warning("instagram_accounts.json not found at %s", INSTAGRAM_ACCOUNTS_PATH)
         return {}
-    
+
+    if _ACCOUNTS_CACHE is not None and _ACCOUNTS_CACHE[0] == mtime:
+        return _ACCOUNTS_CACHE[1]
+
     try:
-        with open(INSTAGRAM_ACCOUNTS_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+        raw = orjson.loads(INSTAGRAM_ACCOUNTS_PATH.read_bytes())
     except Exception as e:
         logger.exception("Failed to load instagram_accounts.json: %s", e)
         return {}
 
+    mapping: dict[str, AccountCfg] = {}
+    for ig_id, entry in raw.items():
+        try:
+            mapping[ig_id] = AccountCfg(
+                org_id=entry["org_id"],
+                connected_account_id=entry["connected_account_id"],
+            )
+        except (KeyError, TypeError):
+            logger.warning("Skipping malformed Instagram account entry: %s", ig_id)
+
+    _ACCOUNTS_CACHE = (mtime, mapping)
+    return mapping
+
+
+# Instagram Business Account ID -> Composio account details, loaded at startup
+_ACCOUNT_MAP: dict[str, AccountCfg] = {}
+
+
+@lru_cache(maxsize=256)
+def _account_cfg(instagram_business_account_id: str) -> AccountCfg | None:
+    """Memoised lookup into _ACCOUNT_MAP; cleared whenever the mapping changes."""
+    return _ACCOUNT_MAP.get(instagram_business_account_id)
+
 
-def get_composio_account_for_instagram(instagram_business_account_id: str) -> dict[str, str] | None:
+def _refresh_account_map() -> dict[str, AccountCfg]:
+    """Pick up the latest mapping, dropping memoised lookups if it was re-parsed."""
+    global _ACCOUNT_MAP
+    mapping = load_instagram_account_mapping()
+    if mapping is not _ACCOUNT_MAP:
+        _ACCOUNT_MAP = mapping
+        _account_cfg.cache_clear()
+    return mapping
+
+
+def get_composio_account_for_instagram(instagram_business_account_id: str) -> AccountCfg | None:
     """
     Get Composio account details for an Instagram Business Account ID.
+    The mapping is only re-parsed when instagram_accounts.json changes on disk.
     
     Returns:
-        dict with 'org_id' and 'connected_account_id', or None if not found
+        AccountCfg with org_id and connected_account_id, or None if not found
     """
-    accounts = load_instagram_account_mapping()
-    return accounts.get(instagram_business_account_id)
+    _refresh_account_map()
+    return _account_cfg(instagram_business_account_id)
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the Instagram account mapping once before serving requests."""
+    logger.info("Loaded %d Instagram account mappings", len(_refresh_account_map()))
+    yield
+    await _composio_http.aclose()
+    await close_rag_client()
 
-app = FastAPI(title="Instagram Webhook Handler")
+
+app = FastAPI(title="Instagram Webhook Handler", lifespan=lifespan)
 
 
 @app.get("/")
@@ -69,6 +179,14 @@ async def root() -> dict[str, str]:
     return {"status": "ok", "service": "instagram-webhook"}
 
 
+@app.post("/instagram/reload-accounts")
+async def reload_instagram_accounts() -> dict[str, Any]:
+    """Re-read instagram_accounts.json without restarting the service."""
+    count = len(_refresh_account_map())
+    logger.info("Reloaded %d Instagram account mappings", count)
+    return {"ok": True, "accounts": count}
+
+
 @app.get("/instagram/webhook")
 async def instagram_webhook_verify(
     request: Request,
@@ -108,7 +226,7 @@ async def process_instagram_message(
         logger.info("Got reply from /chat API: %s", reply[:100])
         
         # Send DM via Composio
-        result = composio_client.tools.execute(
+        result = await _composio_execute(
             slug="INSTAGRAM_SEND_TEXT_MESSAGE",
             arguments={
                 "ig_user_id": sender_id,
@@ -116,7 +234,7 @@ async def process_instagram_message(
             },
             user_id=org_id,
             connected_account_id=connected_account_id,
-            dangerously_skip_version_check=True,
+            version=INSTAGRAM_TOOLKIT_VERSION,
         )
         
         if result.get("successful"):
@@ -143,7 +261,7 @@ async def process_instagram_comment(
         )
         
         # Send hardcoded reply via Composio
-        result = composio_client.tools.execute(
+        result = await _composio_execute(
             slug="INSTAGRAM_REPLY_TO_COMMENT",
             arguments={
                 "ig_comment_id": comment_id,
@@ -151,7 +269,7 @@ async def process_instagram_comment(
             },
             user_id=org_id,
             connected_account_id=connected_account_id,
-            dangerously_skip_version_check=True,
+            version=INSTAGRAM_TOOLKIT_VERSION,
         )
         
         if result.get("successful"):
@@ -164,17 +282,30 @@ async def process_instagram_comment(
 
 
 @app.post("/instagram/webhook")
-async def instagram_webhook(request: Request) -> JSONResponse:
+async def instagram_webhook(request: Request, background_tasks: BackgroundTasks) -> JSONResponse:
     """
     Handle Instagram webhook events (DMs and comments).
     Returns 200 OK immediately and processes in background.
     """
+    # Meta signs every webhook delivery; unsigned requests are probes or noise
+    if "x-hub-signature-256" not in request.headers:
+        logger.debug("Ignoring unsigned request to /instagram/webhook")
+        return JSONResponse({"ok": True})
+    
     try:
-        payload = await request.json()
-        logger.info("Received Instagram webhook payload: %s", json.dumps(payload, indent=2))
+        body = await request.body()
+        # Cheap byte scan so non-Instagram deliveries are dropped without a full parse
+        if b'"instagram"' not in body:
+            logger.debug("Ignoring non-Instagram webhook body (%d bytes)", len(body))
+            return JSONResponse({"ok": True})
+        
+        payload = orjson.loads(body)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received Instagram webhook payload: %s", orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode())
         
-        # Return 200 OK immediately to avoid timeout
-        asyncio.create_task(handle_instagram_webhook(payload))
+        # Return 200 OK immediately to avoid timeout; the server runs the task after
+        # the response is sent and waits for it on graceful shutdown
+        background_tasks.add_task(handle_instagram_webhook, payload)
         return JSONResponse({"ok": True})
     
     except Exception as e:
@@ -189,61 +320,74 @@ async def handle_instagram_webhook(payload: dict[str, Any]) -> None:
             logger.warning("Received non-Instagram webhook: %s", payload.get("object"))
             return
         
+        # Entries are independent (one per account), so process them concurrently
         entries = payload.get("entry", [])
-        for entry in entries:
-            # Get Instagram Business Account ID from entry
-            instagram_business_account_id = entry.get("id")
-            if not instagram_business_account_id:
-                logger.warning("Entry missing Instagram Business Account ID: %s", entry)
-                continue
-            
-            # Get Composio account details
-            account_info = get_composio_account_for_instagram(instagram_business_account_id)
-            if not account_info:
-                logger.warning(
-                    "No account mapping found for Instagram Business Account ID: %s",
-                    instagram_business_account_id,
-                )
-                continue
+        await asyncio.gather(*(handle_instagram_entry(entry) for entry in entries))
+    
+    except Exception as e:
+        logger.exception("Error in handle_instagram_webhook: %s", e)
+
+
+async def handle_instagram_entry(entry: dict[str, Any]) -> None:
+    """Process the comment and message changes of a single webhook entry."""
+    try:
+        # Get Instagram Business Account ID from entry
+        instagram_business_account_id = entry.get("id")
+        if not instagram_business_account_id:
+            logger.warning("Entry missing Instagram Business Account ID: %s", entry)
+            return
+        
+        # Get Composio account details
+        account_info = get_composio_account_for_instagram(instagram_business_account_id)
+        if not account_info:
+            logger.warning(
+                "No account mapping found for Instagram Business Account ID: %s",
+                instagram_business_account_id,
+            )
+            return
+        
+        org_id = account_info.org_id
+        connected_account_id = account_info.connected_account_id
+        
+        # Process changes (comments or messages); each one is an independent
+        # conversation, so they run concurrently
+        tasks: list[asyncio.Task] = []
+        changes = entry.get("changes", [])
+        for change in changes:
+            value = change.get("value", {})
+            field = change.get("field")
             
-            org_id = account_info["org_id"]
-            connected_account_id = account_info["connected_account_id"]
+            # Handle comments
+            if field == "comments":
+                comment_id = value.get("id")
+                if comment_id:
+                    tasks.append(asyncio.create_task(_bounded(process_instagram_comment(
+                        comment_id=comment_id,
+                        instagram_business_account_id=instagram_business_account_id,
+                        org_id=org_id,
+                        connected_account_id=connected_account_id,
+                    ))))
             
-            # Process changes (comments or messages)
-            changes = entry.get("changes", [])
-            for change in changes:
-                value = change.get("value", {})
-                field = change.get("field")
-                
-                # Handle comments
-                if field == "comments":
-                    comment_id = value.get("id")
-                    if comment_id:
-                        await process_instagram_comment(
-                            comment_id=comment_id,
+            # Handle messages (DMs)
+            elif field == "messages":
+                messages = value.get("messages", [])
+                for message in messages:
+                    sender_id = message.get("from", {}).get("id")
+                    message_text = message.get("text", "").strip()
+                    
+                    if sender_id and message_text:
+                        tasks.append(asyncio.create_task(_bounded(process_instagram_message(
+                            sender_id=sender_id,
+                            message_text=message_text,
                             instagram_business_account_id=instagram_business_account_id,
                             org_id=org_id,
                             connected_account_id=connected_account_id,
-                        )
-                
-                # Handle messages (DMs)
-                elif field == "messages":
-                    messages = value.get("messages", [])
-                    for message in messages:
-                        sender_id = message.get("from", {}).get("id")
-                        message_text = message.get("text", "").strip()
-                        
-                        if sender_id and message_text:
-                            await process_instagram_message(
-                                sender_id=sender_id,
-                                message_text=message_text,
-                                instagram_business_account_id=instagram_business_account_id,
-                                org_id=org_id,
-                                connected_account_id=connected_account_id,
-                            )
+                        ))))
+        
+        await asyncio.gather(*tasks, return_exceptions=True)
     
     except Exception as e:
-        logger.exception("Error in handle_instagram_webhook: %s", e)
+        logger.exception("Error in handle_instagram_entry: %s", e)
 
 
 if __name__ == "__main__":
@@ -2,18 +2,72 @@
 
 from __future__ import annotations
 
+import asyncio
 import os
 from typing import Any
 
 import httpx
 from dotenv import load_dotenv
 
+try:
+    import h2  # noqa: F401 - lets httpx negotiate HTTP/2
+except ImportError:  # pragma: no cover - optional dependency
+    h2 = None
+
 load_dotenv()
 
 RAG_CHAT_API_URL = os.getenv(
     "RAG_CHAT_API_URL", "https://rag-super-agent.onrender.com/chat/"
 )
 
+# Retry policy for transient failures (cold starts on Render, dropped connections, 429s)
+_MAX_ATTEMPTS = 3
+_BACKOFF_BASE_SECONDS = 0.5
+_MAX_RETRY_AFTER_SECONDS = 10.0
+_RETRYABLE_ERRORS = (
+    httpx.TimeoutException,
+    httpx.ConnectError,
+    httpx.ReadError,
+    httpx.RemoteProtocolError,
+)
+
+# Shared client so consecutive RAG calls reuse the keep-alive HTTPS connection;
+# with HTTP/2 (negotiated via ALPN) concurrent calls multiplex over one connection
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(25.0),
+            http2=h2 is not None,
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=60.0,
+            ),
+        )
+    return _client
+
+
+async def close_rag_client() -> None:
+    """Close the shared AsyncClient. Call this from the app's shutdown hook."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None = None) -> float:
+    """Seconds to wait before the next attempt, honouring Retry-After when given."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), _MAX_RETRY_AFTER_SECONDS)
+    return _BACKOFF_BASE_SECONDS * 2 ** attempt
+
 
 async def call_rag_chat_api(
     message: str,
@@ -22,11 +76,13 @@ async def call_rag_chat_api(
 ) -> dict[str, Any]:
     """
     Call the RAG Super Agent chat API with a user message.
+    Transient failures (timeouts, dropped connections, 429) are retried with
+    exponential backoff, up to _MAX_ATTEMPTS attempts.
     
     Args:
         message: The user's message (can be a question, URL, or text to ingest)
         conversation_id: Optional conversation ID for context tracking
-        timeout: Request timeout in seconds
+        timeout: Request timeout in seconds (per attempt)
         
     Returns:
         Response dictionary with message, type, data, conversation_id, and suggestions
@@ -35,21 +91,31 @@ async def call_rag_chat_api(
     if conversation_id:
         payload["conversation_id"] = conversation_id
     
-    try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(
+    for attempt in range(_MAX_ATTEMPTS):
+        is_last_attempt = attempt == _MAX_ATTEMPTS - 1
+        try:
+            response = await _get_client().post(
                 RAG_CHAT_API_URL,
                 json=payload,
                 headers={"accept": "application/json", "Content-Type": "application/json"},
+                timeout=timeout,
             )
+            if response.status_code == 429 and not is_last_attempt:
+                await asyncio.sleep(_retry_delay(attempt, response))
+                continue
             response.raise_for_status()
             return response.json()
-    except httpx.TimeoutException:
-        raise TimeoutError(f"RAG chat API request timed out after {timeout} seconds")
-    except httpx.HTTPStatusError as e:
-        raise Exception(f"RAG chat API returned error {e.response.status_code}: {e.response.text}")
-    except Exception as e:
-        raise Exception(f"Failed to call RAG chat API: {str(e)}")
+        except _RETRYABLE_ERRORS as e:
+            if is_last_attempt:
+                if isinstance(e, httpx.TimeoutException):
+                    raise TimeoutError(f"RAG chat API request timed out after {timeout} seconds")
+                raise Exception(f"Failed to call RAG chat API: {str(e)}")
+            await asyncio.sleep(_retry_delay(attempt))
+        except httpx.HTTPStatusError as e:
+            raise Exception(f"RAG chat API returned error {e.response.status_code}: {e.response.text}")
+        except Exception as e:
+            raise Exception(f"Failed to call RAG chat API: {str(e)}")
+    raise Exception("Failed to call RAG chat API: retries exhausted")
 
 
 async def get_rag_chat_response(
@@ -80,6 +146,7 @@ async def get_rag_chat_response(
 __all__ = [
     "call_rag_chat_api",
     "get_rag_chat_response",
+    "close_rag_client",
     "RAG_CHAT_API_URL",
 ]
 
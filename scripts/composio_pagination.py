@@ -0,0 +1,23 @@
+"""Cursor pagination over Composio connected account listings, shared by the sync scripts."""
+
+from composio import Composio
+
+# Accounts requested per connected_accounts.list call
+_PAGE_SIZE = 100
+
+
+def iter_connected_accounts(client: Composio, **list_kwargs):
+    """Yield connected accounts one page at a time, following next_cursor."""
+    cursor = None
+    while True:
+        page_kwargs = {**list_kwargs, "limit": _PAGE_SIZE}
+        if cursor:
+            page_kwargs["cursor"] = cursor
+        page = client.connected_accounts.list(**page_kwargs)
+        yield from page.items
+        cursor = getattr(page, "next_cursor", None)
+        if not cursor or not page.items:
+            return
+
+
+__all__ = ["iter_connected_accounts"]
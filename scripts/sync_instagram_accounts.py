@@ -1,16 +1,49 @@
 """Script to sync all Instagram connected accounts from Composio to instagram_accounts.json"""
 
 import argparse
-import json
+import hashlib
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
 
+import orjson
 from dotenv import load_dotenv
 from composio import Composio
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
+from scripts.composio_pagination import iter_connected_accounts
+
+# Keys that may hold the Instagram Business Account ID, in priority order
+_IG_ID_KEYS = ("instagram_business_account_id", "ig_id", "business_account_id")
+_STATE_IG_ID_KEYS = _IG_ID_KEYS + ("id",)
+
+# (attribute path on the account, keys to probe there), in lookup order
+_IG_ID_SOURCES = (
+    (("state", "val"), _STATE_IG_ID_KEYS),
+    (("metadata",), _IG_ID_KEYS),
+    (("config",), _IG_ID_KEYS),
+)
+
+# Local cache of the (slow, rarely changing) connected account listing
+_CACHE_DIR = Path(".cache")
+_DEFAULT_CACHE_TTL_SECONDS = 300
+
+_DEFAULT_AUTH_CONFIG_ID = "ac_Mx2tzfHQLGKj"
+
+# Fields read from every Composio connected account model, fetched in one C-level call
+_ACCOUNT_FIELDS = attrgetter("id", "user_id", "status", "updated_at")
+
+
+def _atomic_write_bytes(target: Path, data: bytes) -> None:
+    """Write to a sibling temp file and rename it over target, so readers never see a torn file."""
+    tmp = target.with_suffix(target.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, target)
 
 
 def parse_args() -> argparse.Namespace:
@@ -30,10 +63,34 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--auth-config-id",
-        default="ac_Mx2tzfHQLGKj",
-        help="Instagram Auth Config ID (default: ac_Mx2tzfHQLGKj)",
+        action="append",
+        dest="auth_config_ids",
+        help="Instagram Auth Config ID; repeat to sync several concurrently "
+        f"(default: {_DEFAULT_AUTH_CONFIG_ID})",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=_DEFAULT_CACHE_TTL_SECONDS,
+        help=f"Seconds to reuse the cached Composio account list (default: {_DEFAULT_CACHE_TTL_SECONDS})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always fetch accounts from Composio, ignoring the local cache.",
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=("last", "first", "latest"),
+        default="last",
+        help="Which account to keep when several map to the same Instagram ID: "
+        "the last one listed (the original behaviour), the first one listed, "
+        "or the most recently updated (default: last)",
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.auth_config_ids:
+        args.auth_config_ids = [_DEFAULT_AUTH_CONFIG_ID]
+    return args
 
 
 def resolve_user_ids(args: argparse.Namespace) -> list[str] | None:
@@ -44,76 +101,112 @@ def resolve_user_ids(args: argparse.Namespace) -> list[str] | None:
     return None
 
 
+@lru_cache(maxsize=1)
+def get_client() -> Composio:
+    """Composio client shared by all auth-config fetches."""
+    return Composio()
+
+
 def get_instagram_business_account_id_from_account(account) -> str | None:
     """
     Try to extract Instagram Business Account ID from Composio account.
     This might be in metadata, state, or config.
     """
-    # Try different possible locations
-    state = getattr(account, "state", None)
-    if state:
-        val = getattr(state, "val", None)
-        if isinstance(val, dict):
-            # Check common fields
-            for key in ["instagram_business_account_id", "ig_id", "business_account_id", "id"]:
-                if key in val:
-                    return str(val[key])
-    
-    # Check metadata
-    metadata = getattr(account, "metadata", None)
-    if metadata:
-        if isinstance(metadata, dict):
-            for key in ["instagram_business_account_id", "ig_id", "business_account_id"]:
-                if key in metadata:
-                    return str(metadata[key])
-    
-    # Check config
-    config = getattr(account, "config", None)
-    if config:
-        if isinstance(config, dict):
-            for key in ["instagram_business_account_id", "ig_id", "business_account_id"]:
-                if key in config:
-                    return str(config[key])
-    
+    for path, keys in _IG_ID_SOURCES:
+        source = account
+        for attr in path:
+            source = getattr(source, attr, None)
+        if isinstance(source, dict):
+            ig_id = next((source[k] for k in keys if k in source), None)
+            if ig_id is not None:
+                return str(ig_id)
+
     return None
 
 
+def _account_record(account) -> dict[str, str | None]:
+    """Reduce a Composio account to the fields the sync needs (and can be cached)."""
+    account_id, user_id, status, updated_at = _ACCOUNT_FIELDS(account)
+    return {
+        "id": account_id,
+        "user_id": user_id or "",
+        "status": str(status or "").upper(),
+        "updated_at": str(updated_at or ""),
+        "ig_id": get_instagram_business_account_id_from_account(account),
+    }
+
+
+def load_account_records(list_kwargs: dict, ttl: int, use_cache: bool = True) -> list[dict[str, str | None]]:
+    """
+    Return account records for list_kwargs, served from .cache/ while younger than ttl.
+    On a miss the accounts are fetched from Composio and the cache is rewritten atomically.
+    """
+    digest = hashlib.blake2b(orjson.dumps(list_kwargs, option=orjson.OPT_SORT_KEYS), digest_size=8).hexdigest()
+    cache_path = _CACHE_DIR / f"composio_accounts-{digest}.json"
+
+    if use_cache and cache_path.exists():
+        try:
+            cached = orjson.loads(cache_path.read_bytes())
+            if time.time() - cached["ts"] < ttl:
+                print(f"[INFO] Using cached account list from {cache_path}")
+                return cached["items"]
+        except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"[WARN] Ignoring unreadable cache {cache_path}: {e}")
+
+    records = [_account_record(account) for account in iter_connected_accounts(get_client(), **list_kwargs)]
+
+    _CACHE_DIR.mkdir(exist_ok=True)
+    _atomic_write_bytes(cache_path, orjson.dumps({"ts": time.time(), "items": records}))
+    return records
+
+
 def main() -> None:
     args = parse_args()
     load_dotenv()
 
-    client = Composio()
     user_ids = resolve_user_ids(args)
 
-    # Fetch all Instagram accounts
-    # Use only the specified auth config ID
-    list_kwargs = {
-        "toolkit_slugs": ["INSTAGRAM"],
-        "auth_config_ids": [args.auth_config_id],
-    }
-    if user_ids:
-        list_kwargs["user_ids"] = user_ids
+    # Fetch Instagram accounts for each auth config; the listings are independent
+    # network calls, so they run concurrently
+    kwargs_per_auth_config = []
+    for auth_config_id in args.auth_config_ids:
+        list_kwargs = {
+            "toolkit_slugs": ["INSTAGRAM"],
+            "auth_config_ids": [auth_config_id],
+        }
+        if user_ids:
+            list_kwargs["user_ids"] = user_ids
+        kwargs_per_auth_config.append(list_kwargs)
     
     print(f"Fetching Instagram connected accounts...")
-    print(f"Filters: toolkit_slugs={list_kwargs.get('toolkit_slugs')}, auth_config_ids={list_kwargs.get('auth_config_ids')}, user_ids={list_kwargs.get('user_ids')}")
-    accounts = client.connected_accounts.list(**list_kwargs)
-    print(f"Found {len(accounts.items)} total account(s)")
-
+    print(f"Filters: toolkit_slugs=['INSTAGRAM'], auth_config_ids={args.auth_config_ids}, user_ids={user_ids}")
     mapping: dict[str, dict[str, str]] = {}
     accounts_without_ig_id = []
+    updated_at_by_ig_id: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=len(kwargs_per_auth_config)) as pool:
+        # map() keeps results in --auth-config-id order so the merge is deterministic
+        record_lists = pool.map(
+            lambda kwargs: load_account_records(kwargs, args.cache_ttl, use_cache=not args.no_cache),
+            kwargs_per_auth_config,
+        )
+        records = [record for record_list in record_lists for record in record_list]
+    
+    # Nothing to merge: skip the per-account pass and never touch the output file
+    if not any(record["status"] == "ACTIVE" for record in records):
+        print(f"Found {len(records)} total account(s)")
+        print("[WARN] No active Instagram accounts found.")
+        return
     
-    for account in accounts.items:
+    for record in records:
         # Only process ACTIVE accounts
-        status = str(getattr(account, "status", "")).upper()
+        status = record["status"]
         if status != "ACTIVE":
-            print(f"[SKIP] Skipping inactive account: {account.id} (status: {status})")
+            print(f"[SKIP] Skipping inactive account: {record['id']} (status: {status})")
             continue
         
-        org_id = getattr(account, "user_id", "")
-        connected_account_id = account.id
-        
-        # Try to get Instagram Business Account ID
-        ig_business_account_id = get_instagram_business_account_id_from_account(account)
+        org_id = record["user_id"]
+        connected_account_id = record["id"]
+        ig_business_account_id = record["ig_id"]
         
         if not ig_business_account_id:
             # Add account with connected_account_id as temporary key
@@ -128,12 +221,26 @@ def main() -> None:
             print(f"[INFO] Added account with temp key: {connected_account_id} (org: {org_id})")
             print(f"       Will be updated with real Instagram Business Account ID when webhooks arrive")
         else:
+            updated_at = record.get("updated_at") or ""
+            previous = mapping.get(ig_business_account_id)
+            if previous is not None and (
+                args.strategy == "first"
+                or (args.strategy == "latest" and updated_at <= updated_at_by_ig_id[ig_business_account_id])
+            ):
+                print(
+                    f"[SKIP] Keeping {previous['connected_account_id']} for IG ID {ig_business_account_id} "
+                    f"over {connected_account_id} (strategy: {args.strategy})"
+                )
+                continue
+            updated_at_by_ig_id[ig_business_account_id] = updated_at
             mapping[ig_business_account_id] = {
                 "org_id": org_id,
                 "connected_account_id": connected_account_id,
             }
             print(f"[OK] Found account: IG ID {ig_business_account_id} -> {connected_account_id}")
 
+    print(f"Found {len(records)} total account(s)")
+
     if not mapping:
         print("[WARN] No active Instagram accounts found.")
         return
@@ -147,24 +254,21 @@ def main() -> None:
     existing = {}
     if target.exists():
         try:
-            existing = json.loads(target.read_text(encoding="utf-8"))
+            existing = orjson.loads(target.read_bytes())
             print(f"[INFO] Loaded {len(existing)} existing entries from {target}")
-        except (json.JSONDecodeError, Exception) as e:
+        except (orjson.JSONDecodeError, Exception) as e:
             print(f"[WARN] Could not load existing JSON: {e}")
     
     # Merge: existing entries take precedence (don't overwrite manually added entries)
     # But update org_id and connected_account_id if they changed
     # Also, don't overwrite real Instagram Business Account IDs with temp keys
+    known_connected_ids = {entry.get("connected_account_id") for entry in existing.values()}
+    changed = 0
     for ig_id, account_data in mapping.items():
         # Skip temp keys if a real entry already exists for this connected_account_id
         if ig_id.startswith("TEMP_"):
             connected_account_id = account_data["connected_account_id"]
-            # Check if this connected_account_id already exists in existing entries
-            already_exists = any(
-                entry.get("connected_account_id") == connected_account_id 
-                for entry in existing.values()
-            )
-            if already_exists:
+            if connected_account_id in known_connected_ids:
                 print(f"[SKIP] Skipping temp key {ig_id} - connected_account_id {connected_account_id} already exists")
                 continue
         
@@ -172,16 +276,27 @@ def main() -> None:
             # Update org_id and connected_account_id if they exist in new data
             # But don't overwrite if existing entry has real Instagram Business Account ID
             if not ig_id.startswith("TEMP_"):
-                existing[ig_id].update({
+                entry = existing[ig_id]
+                update = {
                     "org_id": account_data["org_id"],
                     "connected_account_id": account_data["connected_account_id"],
-                })
+                }
+                if any(entry.get(k) != v for k, v in update.items()):
+                    entry.update(update)
+                    known_connected_ids.add(update["connected_account_id"])
+                    changed += 1
         else:
             existing[ig_id] = account_data
+            known_connected_ids.add(account_data["connected_account_id"])
+            changed += 1
     
+    if not changed:
+        print(f"[OK] {target} is already up to date ({len(existing)} entries); nothing written.")
+        return
+
     # Write back
-    target.write_text(json.dumps(existing, indent=2), encoding="utf-8")
-    print(f"[OK] Updated {target} with {len(mapping)} entries (total: {len(existing)} entries).")
+    _atomic_write_bytes(target, orjson.dumps(existing, option=orjson.OPT_INDENT_2))
+    print(f"[OK] Updated {target}: {changed} entries added or changed (total: {len(existing)} entries).")
 
 
 if __name__ == "__main__":
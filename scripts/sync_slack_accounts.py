@@ -1,10 +1,13 @@
 import argparse
-import json
 import os
 import sys
-from collections import defaultdict
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from operator import attrgetter
 from pathlib import Path
 
+import orjson
 from dotenv import load_dotenv
 
 from composio import Composio
@@ -13,6 +16,7 @@ from composio_langchain import LangchainProvider
 # Add parent directory to path to import supabase_helpers
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from supabase_helpers import bulk_upsert_slack_accounts
+from scripts.composio_pagination import iter_connected_accounts
 
 
 def parse_args() -> argparse.Namespace:
@@ -46,38 +50,81 @@ def resolve_user_ids(args: argparse.Namespace) -> list[str] | None:
     return None
 
 
+# Cap on concurrent per-user list calls, to stay clear of Composio rate limits
+_MAX_FETCH_WORKERS = 8
+
+
+def fetch_accounts_for_users(client: Composio, user_ids: list[str], **list_kwargs):
+    """Fetch each user's accounts concurrently and chain them in user_ids order."""
+    def fetch_one(uid: str) -> list:
+        return list(iter_connected_accounts(client, **list_kwargs, user_ids=[uid]))
+
+    with ThreadPoolExecutor(max_workers=min(_MAX_FETCH_WORKERS, len(user_ids))) as pool:
+        # map() keeps results in user_ids order so tie-breaking stays deterministic
+        return chain.from_iterable(list(pool.map(fetch_one, user_ids)))
+
+
+# Per-account fields read while normalising, fetched in one C-level call
+_ACCOUNT_FIELDS = attrgetter("state", "status", "updated_at")
+
+# Everything pick_latest_account needs from an ACTIVE Slackbot account, extracted once
+NormalizedAcc = namedtuple(
+    "NormalizedAcc", "team_id updated_at org_id conn_id auth_id bot_user_id"
+)
+
+
+def normalize_account(acc) -> NormalizedAcc | None:
+    """Flatten a Composio account, or return None if it is inactive or has no team."""
+    state, status, updated_at = _ACCOUNT_FIELDS(acc)
+    if str(status or "").upper() != "ACTIVE":
+        return None
+    val = getattr(state, "val", None) if state else None
+    if not val:
+        return None
+    if isinstance(val, dict):
+        team = val.get("team")
+        bot_user_id = val.get("bot_user_id", "") or ""
+    else:
+        team = getattr(val, "team", None)
+        bot_user_id = getattr(val, "bot_user_id", "") or ""
+    team_id = team.get("id") if team else None
+    if not team_id:
+        return None
+    auth_config = acc.auth_config
+    return NormalizedAcc(
+        team_id=team_id,
+        updated_at=updated_at or "",
+        org_id=getattr(acc, "user_id", ""),
+        conn_id=acc.id,
+        auth_id=auth_config.id if auth_config else "",
+        bot_user_id=bot_user_id,
+    )
+
+
 def pick_latest_account(accounts):
-    buckets = defaultdict(list)
-    for acc in accounts.items:
-        state = getattr(acc, "state", None)
-        val = getattr(state, "val", None) if state else None
-        if not val:
-            continue
-        team = val.get("team") if isinstance(val, dict) else getattr(val, "team", None)
-        team_id = team.get("id") if team else None
-        if not team_id:
+    """
+    Fold an iterable of Composio accounts (e.g. iter_connected_accounts) into
+    {team_id: details}, keeping the most recently updated ACTIVE account per team.
+    Only one row per team is held, however many accounts stream past.
+    """
+    latest_by_team: dict[str, NormalizedAcc] = {}
+    for acc in accounts:
+        row = normalize_account(acc)
+        if row is None:
             continue
-        if str(getattr(acc, "status", "")).upper() != "ACTIVE":
-            continue
-        buckets[team_id].append(acc)
-
-    mapping: dict[str, dict[str, str]] = {}
-    for team_id, accs in buckets.items():
-        latest = max(accs, key=lambda a: getattr(a, "updated_at", ""))  # pick most recent
-        bot_user_id = ""
-        state = getattr(latest, "state", None)
-        val = getattr(state, "val", None) if state else None
-        if isinstance(val, dict):
-            bot_user_id = val.get("bot_user_id", "") or ""
-        elif val is not None:
-            bot_user_id = getattr(val, "bot_user_id", "") or ""
-        mapping[team_id] = {
-            "org_id": getattr(latest, "user_id", ""),
-            "connected_account_id": latest.id,
-            "auth_config_id": latest.auth_config.id if latest.auth_config else "",
-            "bot_user_id": bot_user_id,
+        best = latest_by_team.get(row.team_id)
+        if best is None or row.updated_at > best.updated_at:  # first one wins ties
+            latest_by_team[row.team_id] = row
+
+    return {
+        team_id: {
+            "org_id": row.org_id,
+            "connected_account_id": row.conn_id,
+            "auth_config_id": row.auth_id,
+            "bot_user_id": row.bot_user_id,
         }
-    return mapping
+        for team_id, row in latest_by_team.items()
+    }
 
 
 def main() -> None:
@@ -87,12 +134,12 @@ def main() -> None:
     client = Composio(provider=LangchainProvider())
     user_ids = resolve_user_ids(args)
 
-    # Fetch all Slackbot accounts (filter by user_ids only if provided)
+    # Fetch all Slackbot accounts, or each requested user's accounts in parallel
     list_kwargs = {"toolkit_slugs": ["SLACKBOT"]}
     if user_ids:
-        list_kwargs["user_ids"] = user_ids
-    
-    accounts = client.connected_accounts.list(**list_kwargs)
+        accounts = fetch_accounts_for_users(client, user_ids, **list_kwargs)
+    else:
+        accounts = iter_connected_accounts(client, **list_kwargs)
 
     mapping = pick_latest_account(accounts)
 
@@ -115,13 +162,22 @@ def main() -> None:
         existing = {}
         if target.exists():
             try:
-                existing = json.loads(target.read_text(encoding="utf-8"))
-            except (json.JSONDecodeError, Exception):
+                existing = orjson.loads(target.read_bytes())
+            except (orjson.JSONDecodeError, Exception):
                 pass
-        
+
+        changed = sum(1 for tid, row in mapping.items() if existing.get(tid) != row)
+        if not changed:
+            print(f"✅ {target} already up to date ({len(existing)} entries).")
+            return
+
         existing.update(mapping)
-        target.write_text(json.dumps(existing, indent=2), encoding="utf-8")
-        print(f"✅ Also updated {target} with {len(mapping)} entries (total: {len(existing)} entries).")
+        # Write a sibling temp file and rename it into place so a killed sync never
+        # leaves a truncated backup behind
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        tmp.write_bytes(orjson.dumps(existing, option=orjson.OPT_INDENT_2))
+        os.replace(tmp, target)
+        print(f"✅ Also updated {target}: {changed} changed entries (total: {len(existing)} entries).")
 
 
 if __name__ == "__main__":
@@ -1,26 +1,39 @@
 """Slack event handler that routes mentions to DeepAgent and replies via Composio."""
 
 from __future__ import annotations
+import asyncio
 import hmac
-import json
 import uuid
 from collections import deque
 import logging
 import os
+import re
+import threading
 import time
 from contextlib import asynccontextmanager
-from hashlib import sha256
+from functools import lru_cache
 from typing import Any
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from composio import Composio
-from composio_langchain import LangchainProvider
-from rag_chat_helpers import get_rag_chat_response
-from supabase_helpers import load_slack_mapping_from_supabase, bulk_upsert_slack_accounts
+from composio_singleton import get_composio
+from rag_chat_helpers import close_rag_client, get_rag_chat_response
+from task_helpers import seen_in_redis, spawn
+from supabase_helpers import (
+    bulk_upsert_slack_accounts,
+    get_slack_account,
+    load_slack_mapping_from_supabase,
+)
+from scripts.composio_pagination import iter_connected_accounts
 from scripts.sync_slack_accounts import pick_latest_account
 
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - optional dependency
+    redis_asyncio = None  # type: ignore
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -30,30 +43,48 @@ logger.propagate = True
 logger.info("Slack app module loaded")
 
 SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET", "")
+_SIGNING_SECRET_BYTES = SLACK_SIGNING_SECRET.encode()
+# Slack's replay window for X-Slack-Request-Timestamp
+_MAX_REQUEST_AGE_SECONDS = 60 * 5
 SLACK_BOT_FALLBACK = os.getenv("SLACK_BOT_USER_ID", "")
 SLACK_AUTH_CONFIG_ID = os.getenv("SLACK_AUTH_CONFIG_ID", "")
 
 # Sync interval in seconds (default: 5 minutes, can be overridden via env)
 SYNC_INTERVAL = int(os.getenv("SLACK_SYNC_INTERVAL_SECONDS", "60"))
 
-_processed_event_ids: deque[str] = deque()
+# Recently seen event IDs: the bounded deque evicts oldest-first, the set answers lookups
+_DEDUPE_CAPACITY = 500
+_processed_event_ids: deque[str] = deque(maxlen=_DEDUPE_CAPACITY)
 _processed_event_index: set[str] = set()
 
+# Shared dedupe across replicas when REDIS_URL is set (Slack retries may hit any of them)
+_DEDUPE_TTL_SECONDS = 600
+REDIS_URL = os.getenv("REDIS_URL", "")
+_redis = (
+    redis_asyncio.Redis.from_url(REDIS_URL, max_connections=10)
+    if redis_asyncio and REDIS_URL
+    else None
+)
+
 # Cache for Slack account mappings (refreshed periodically)
 _slack_account_map_cache: dict[str, Any] = {}
 _cache_last_updated: float = 0
 _cache_ttl: int = 60  # Cache TTL in seconds
+_cache_refresh_lock = threading.Lock()
 
 
-def _is_duplicate(event_id: str) -> bool:
+async def _is_duplicate(event_id: str) -> bool:
     if event_id in _processed_event_index:
         return True
+    if len(_processed_event_ids) == _DEDUPE_CAPACITY:
+        # append() below pushes out the oldest ID; drop it from the index too
+        _processed_event_index.discard(_processed_event_ids[0])
     _processed_event_ids.append(event_id)
     _processed_event_index.add(event_id)
-    while len(_processed_event_ids) > 500:
-        old = _processed_event_ids.popleft()
-        _processed_event_index.discard(old)
-    return False
+
+    # Slack retries may land on any replica
+    return await seen_in_redis(_redis, f"slack:evt:{event_id}", _DEDUPE_TTL_SECONDS)
+
 
 DEFAULT_RESPONSE_TEXT = os.getenv(
     "SLACK_DEFAULT_RESPONSE",
@@ -68,20 +99,32 @@ def get_slack_account_map() -> dict[str, Any]:
     """
     global _slack_account_map_cache, _cache_last_updated
     
-    current_time = time.time()
+    # Readers take one snapshot of the dict; refreshes rebind it rather than mutate it
+    cache = _slack_account_map_cache
+    if time.time() - _cache_last_updated <= _cache_ttl:
+        return cache
     
-    # Refresh cache if expired
-    if current_time - _cache_last_updated > _cache_ttl:
+    # Only one thread refreshes; the others keep serving the stale snapshot
+    # (or wait, if there is nothing to serve yet)
+    if not _cache_refresh_lock.acquire(blocking=not cache):
+        return cache
+    try:
+        if time.time() - _cache_last_updated <= _cache_ttl:
+            return _slack_account_map_cache  # refreshed while we waited for the lock
         try:
-            _slack_account_map_cache = load_slack_mapping_from_supabase()
-            _cache_last_updated = current_time
-            logger.info(f"Refreshed Slack account cache with {len(_slack_account_map_cache)} entries")
+            fresh = load_slack_mapping_from_supabase()
         except Exception as e:
-            logger.error(f"Failed to load Slack accounts from Supabase: {e}")
+            logger.error("Failed to load Slack accounts from Supabase: %s", e)
             if not _slack_account_map_cache:
                 raise RuntimeError(f"Failed to load Slack accounts and cache is empty: {e}")
-    
-    return _slack_account_map_cache
+            return _slack_account_map_cache
+        _slack_account_map_cache = fresh
+        _cache_last_updated = time.time()
+        _clear_workspace_caches()
+        logger.info("Refreshed Slack account cache with %d entries", len(fresh))
+        return fresh
+    finally:
+        _cache_refresh_lock.release()
 
 
 def sync_slack_accounts_to_supabase() -> None:
@@ -92,47 +135,49 @@ def sync_slack_accounts_to_supabase() -> None:
     try:
         logger.info("Starting background sync of Slack accounts to Supabase...")
         
-        client = Composio(provider=LangchainProvider())
+        client = get_composio()
         
         # Fetch all Slackbot accounts (no user_ids filter means fetch all)
-        accounts = client.connected_accounts.list(toolkit_slugs=["SLACKBOT"])
-        mapping = pick_latest_account(accounts)
+        mapping = pick_latest_account(iter_connected_accounts(client, toolkit_slugs=["SLACKBOT"]))
         
         if mapping:
             count = bulk_upsert_slack_accounts(mapping)
-            logger.info(f"Synced {count} Slack accounts to Supabase")
+            logger.info("Synced %d Slack accounts to Supabase", count)
             
             # Invalidate cache to force refresh on next access
             global _cache_last_updated
             _cache_last_updated = 0
+            _clear_workspace_caches()
         else:
             logger.info("No new Slack accounts to sync")
     except Exception as e:
-        logger.error(f"Background sync failed: {e}", exc_info=True)
-
+        logger.error("Background sync failed: %s", e, exc_info=True)
 
-# Initialize cache on startup
-try:
-    _slack_account_map_cache = load_slack_mapping_from_supabase()
-    _cache_last_updated = time.time()
-    logger.info(f"Loaded {len(_slack_account_map_cache)} Slack accounts from Supabase on startup")
-except Exception as e:
-    logger.warning(f"Failed to load Slack accounts on startup: {e}. Will retry on first request.")
 
-composio_client = Composio(provider=LangchainProvider())
+def _load_slack_account_cache() -> None:
+    """Prime the Slack account cache from Supabase."""
+    global _slack_account_map_cache, _cache_last_updated
+    try:
+        _slack_account_map_cache = load_slack_mapping_from_supabase()
+        _cache_last_updated = time.time()
+        _clear_workspace_caches()
+        logger.info("Loaded %d Slack accounts from Supabase on startup", len(_slack_account_map_cache))
+    except Exception as e:
+        logger.warning("Failed to load Slack accounts on startup: %s. Will retry on first request.", e)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Lifespan context manager for FastAPI.
-    Starts background sync task and stops it on shutdown.
+    Loads the account cache, then starts the background sync task (whose first
+    sync runs once the app is serving) and stops it on shutdown.
     """
-    import asyncio
+    await asyncio.to_thread(_load_slack_account_cache)
     
-    # Start background sync task
-    sync_task = asyncio.create_task(background_sync_loop())
-    logger.info(f"Started background sync task (interval: {SYNC_INTERVAL}s)")
+    # Start background sync task; a slow or failing Composio never holds up boot
+    sync_task = spawn(background_sync_loop())
+    logger.info("Started background sync task (interval: %ds)", SYNC_INTERVAL)
     
     yield
     
@@ -142,22 +187,28 @@ async def lifespan(app: FastAPI):
         await sync_task
     except asyncio.CancelledError:
         logger.info("Background sync task stopped")
+    if _redis is not None:
+        await _redis.aclose()
+    await close_rag_client()
 
 
 async def background_sync_loop() -> None:
-    """Background task that syncs Slack accounts periodically."""
-    import asyncio
-    
+    """
+    Background task that syncs Slack accounts now and then every SYNC_INTERVAL,
+    refreshing the account cache after each sync so event handling never has to.
+    """
     while True:
         try:
-            await asyncio.sleep(SYNC_INTERVAL)
             # Run sync in thread pool to avoid blocking
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(None, sync_slack_accounts_to_supabase)
+            await loop.run_in_executor(None, get_slack_account_map)
+            await asyncio.sleep(SYNC_INTERVAL)
         except asyncio.CancelledError:
             break
         except Exception as e:
-            logger.error(f"Background sync loop error: {e}", exc_info=True)
+            logger.error("Background sync loop error: %s", e, exc_info=True)
+            await asyncio.sleep(SYNC_INTERVAL)
 
 
 app = FastAPI(
@@ -184,15 +235,20 @@ def verify_slack_signature(request: Request, raw_body: bytes) -> None:
     if not timestamp or not signature:
         raise HTTPException(status_code=401, detail="Missing Slack signature headers")
 
-    if abs(time.time() - int(timestamp)) > 60 * 5:
+    # Integer seconds only; a malformed header is rejected rather than raising a 500
+    try:
+        age = int(time.time()) - int(timestamp)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid Slack request timestamp")
+    if not -_MAX_REQUEST_AGE_SECONDS <= age <= _MAX_REQUEST_AGE_SECONDS:
         raise HTTPException(status_code=401, detail="Slack request timestamp too old")
 
-    base_string = f"v0:{timestamp}:{raw_body.decode('utf-8')}"
-    my_signature = "v0=" + hmac.new(
-        SLACK_SIGNING_SECRET.encode(), base_string.encode(), sha256
-    ).hexdigest()
+    # Sign the raw bytes directly instead of decoding the body only to re-encode it;
+    # hmac.digest is OpenSSL's one-shot HMAC, with no Python-level HMAC object
+    digest = hmac.digest(_SIGNING_SECRET_BYTES, b"v0:" + timestamp.encode("ascii") + b":" + raw_body, "sha256")
+    my_signature = b"v0=" + digest.hex().encode("ascii")
 
-    if not hmac.compare_digest(my_signature, signature):
+    if not hmac.compare_digest(my_signature, signature.encode()):
         raise HTTPException(status_code=401, detail="Invalid Slack signature")
 
 
@@ -211,7 +267,7 @@ def send_slack_message(
     if thread_ts:
         arguments["thread_ts"] = thread_ts
 
-    return composio_client.tools.execute(
+    return get_composio().tools.execute(
         slug="SLACKBOT_CHAT_POST_MESSAGE",
         arguments=arguments,
         user_id=org_id,
@@ -221,23 +277,67 @@ def send_slack_message(
     )
 
 
-def resolve_workspace(team_id: str) -> tuple[str, str, str]:
-    """Resolve workspace details from team_id using Supabase cache."""
-    slack_account_map = get_slack_account_map()
-    if team_id not in slack_account_map:
-        raise HTTPException(status_code=400, detail=f"Unknown team_id {team_id}")
-    entry = slack_account_map[team_id]
+@lru_cache(maxsize=1024)
+def _resolve_from_db(team_id: str) -> dict[str, Any] | None:
+    """
+    Look up a team missing from the account cache directly in Supabase.
+    None is memoised too, so unknown teams don't cost a query per event.
+    """
+    return get_slack_account(team_id)
+
+
+def _clear_workspace_caches() -> None:
+    """Forget memoised team lookups; call after the account cache changes."""
+    resolve_workspace.cache_clear()
+    _resolve_from_db.cache_clear()
+
+
+def _workspace_details(entry: dict[str, Any]) -> tuple[str, str, str]:
     bot_user_id = entry.get("bot_user_id") or SLACK_BOT_FALLBACK
     return entry["org_id"], entry["connected_account_id"], bot_user_id
 
 
+@lru_cache(maxsize=1024)
+def resolve_workspace(team_id: str) -> tuple[str, str, str]:
+    """
+    Resolve workspace details from team_id using the in-memory account cache.
+    Never does I/O, so it is safe to call on the event loop; results are memoised
+    per team and cleared whenever the account cache is reloaded.
+    """
+    entry = _slack_account_map_cache.get(team_id)
+    if entry is None:
+        raise HTTPException(status_code=400, detail=f"Unknown team_id {team_id}")
+    return _workspace_details(entry)
+
+
+def resolve_workspace_from_db(team_id: str) -> tuple[str, str, str]:
+    """
+    Resolve a team missing from the account cache (installed since the last refresh?)
+    straight from Supabase. Blocking; run it in a worker thread.
+    """
+    try:
+        entry = _resolve_from_db(team_id)
+    except RuntimeError as e:
+        logger.error("Failed to look up team %s in Supabase: %s", team_id, e)
+        entry = None
+    if entry is None:
+        raise HTTPException(status_code=400, detail=f"Unknown team_id {team_id}")
+    return _workspace_details(entry)
+
+
+@lru_cache(maxsize=256)
+def _mention_re(bot_user_id: str) -> re.Pattern[str]:
+    """Matches the `<@U123>` token Slack uses to mention a bot, compiled once per bot user ID."""
+    return re.compile(f"<@{re.escape(bot_user_id)}>")
+
+
 def is_bot_mention(event: dict[str, Any], bot_user_id: str) -> bool:
     event_type = event.get("type")
     if event_type == "app_mention":
         return True
     if event_type == "message":
         text = event.get("text", "")
-        return bool(bot_user_id and f"<@{bot_user_id}>" in text)
+        return bool(bot_user_id and _mention_re(bot_user_id).search(text))
     return False
 
 
@@ -252,7 +352,7 @@ def generate_slack_oauth_link(org_id: str | None = None, auth_config_id: str | N
         
         config_id = auth_config_id or SLACK_AUTH_CONFIG_ID
         
-        client = Composio(provider=LangchainProvider())
+        client = get_composio()
         connection = client.connected_accounts.link(
             user_id=org_id,
             auth_config_id=config_id,
@@ -265,7 +365,7 @@ def generate_slack_oauth_link(org_id: str | None = None, auth_config_id: str | N
             "auth_config_id": config_id,
         }
     except Exception as e:
-        logger.error(f"Failed to generate Slack OAuth link: {e}", exc_info=True)
+        logger.error("Failed to generate Slack OAuth link: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to generate OAuth link: {str(e)}")
 
 
@@ -300,9 +400,9 @@ async def get_slack_oauth_link(
         GET /slack/generate-link?org_id=org_custom123
     """
     try:
-        logger.info(f"Received request to generate Slack OAuth link (org_id: {org_id})")
+        logger.info("Received request to generate Slack OAuth link (org_id: %s)", org_id)
         result = generate_slack_oauth_link(org_id=org_id, auth_config_id=auth_config_id)
-        logger.info(f"Successfully generated Slack OAuth link for org_id: {result['org_id']}")
+        logger.info("Successfully generated Slack OAuth link for org_id: %s", result['org_id'])
         return JSONResponse(
             content=result,
             status_code=200,
@@ -313,12 +413,12 @@ async def get_slack_oauth_link(
             }
         )
     except HTTPException as e:
-        logger.error(f"HTTPException in generate-link: {e.detail}")
+        logger.error("HTTPException in generate-link: %s", e.detail)
         raise
     except Exception as e:
-        logger.error(f"Error generating Slack OAuth link: {e}", exc_info=True)
+        logger.error("Error generating Slack OAuth link: %s", e, exc_info=True)
         import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Traceback: %s", traceback.format_exc())
         return JSONResponse(
             content={
                 "success": False,
@@ -337,20 +437,14 @@ async def get_slack_oauth_link(
 @app.post("/slack/events")
 async def slack_events(request: Request):
     raw_body = await request.body()
-    headers = dict(request.headers)
-    logger.info("Incoming headers: %s", headers)
-    print("Incoming headers:", headers)
     
     # Parse JSON from raw_body (don't read body twice)
     try:
-        payload = json.loads(raw_body.decode('utf-8'))
-    except json.JSONDecodeError as e:
+        payload = orjson.loads(raw_body)
+    except orjson.JSONDecodeError as e:
         logger.error("Failed to parse JSON: %s", e)
         raise HTTPException(status_code=400, detail="Invalid JSON")
     
-    logger.info("Received payload: %s", payload)
-    print("Received payload:", payload)
-
     # Handle URL verification BEFORE signature verification
     # Slack's URL verification doesn't require signature verification
     if payload.get("type") == "url_verification":
@@ -360,13 +454,17 @@ async def slack_events(request: Request):
     
     # For all other requests, verify signature
     verify_slack_signature(request, raw_body)
+    # Skip building the headers dict entirely unless debug logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Incoming headers: %s", dict(request.headers))
+        logger.debug("Received payload: %s", payload)
 
     event = payload.get("event", {})
     if not event:
         return JSONResponse({"ok": True})
 
     event_id = payload.get("event_id") or event.get("client_msg_id")
-    if event_id and _is_duplicate(event_id):
+    if event_id and await _is_duplicate(event_id):
         logger.info("Duplicate event %s detected; ignoring", event_id)
         return JSONResponse({"ok": True})
 
@@ -378,19 +476,22 @@ async def slack_events(request: Request):
 
     if event.get("bot_id"):
         logger.info("Ignoring bot event: %s", event)
-        print("Ignoring bot event:", event)
         return JSONResponse({"ok": True})
 
     if not team_id or not channel:
         logger.warning("Missing team_id/channel in event: %s", event)
-        print("Missing team/channel:", event)
         return JSONResponse({"ok": True})
 
     try:
-        org_id, connected_account_id, bot_user_id = resolve_workspace(team_id)
+        try:
+            org_id, connected_account_id, bot_user_id = resolve_workspace(team_id)
+        except HTTPException:
+            # Only the Supabase fallback does I/O, so only it leaves the event loop
+            org_id, connected_account_id, bot_user_id = await asyncio.to_thread(
+                resolve_workspace_from_db, team_id
+            )
     except HTTPException as exc:
         logger.error("Team lookup failed for %s: %s", team_id, exc.detail)
-        print("Lookup failed:", team_id, exc.detail)
         return JSONResponse({"ok": False, "error": exc.detail})
 
     if bot_user_id and user_id == bot_user_id:
@@ -399,30 +500,51 @@ async def slack_events(request: Request):
 
     if not is_bot_mention(event, bot_user_id):
         logger.info("Event is not a mention: %s", event)
-        print("Not a mention:", event)
         return JSONResponse({"ok": True})
 
+    # Ack within Slack's 3s window; the RAG call and reply happen in the background
+    spawn(_process_event(
+        org_id=org_id,
+        connected_account_id=connected_account_id,
+        bot_user_id=bot_user_id,
+        channel=channel,
+        thread_ts=thread_ts,
+        user_text=user_text,
+    ))
+    return JSONResponse({"ok": True})
+
+
+async def _process_event(
+    *,
+    org_id: str,
+    connected_account_id: str,
+    bot_user_id: str,
+    channel: str,
+    thread_ts: str | None,
+    user_text: str,
+) -> None:
+    """Get a RAG reply for a mention and post it back to the channel."""
     try:
         cleaned_text = user_text
         if bot_user_id:
-            cleaned_text = cleaned_text.replace(f"<@{bot_user_id}>", "").strip()
+            cleaned_text = _mention_re(bot_user_id).sub("", cleaned_text).strip()
         logger.info("Dispatching to RAG chat API with text: %s", cleaned_text)
-        print("Dispatching text:", cleaned_text)
         reply = await get_rag_chat_response(cleaned_text or user_text)
     except Exception as agent_error:  # pragma: no cover
         logger.exception("RAG chat API invocation failed: %s", agent_error)
-        print("RAG chat API failed:", agent_error)
         reply = f"{DEFAULT_RESPONSE_TEXT}\n\n(Error: {agent_error})"
 
-    response = send_slack_message(
-        org_id=org_id,
-        connected_account_id=connected_account_id,
-        channel=channel,
-        text=reply,
-        thread_ts=thread_ts,
-    )
+    try:
+        response = await asyncio.to_thread(
+            send_slack_message,
+            org_id=org_id,
+            connected_account_id=connected_account_id,
+            channel=channel,
+            text=reply,
+            thread_ts=thread_ts,
+        )
+    except Exception as send_error:
+        logger.exception("Failed to send Slack reply via Composio: %s", send_error)
+        return
     logger.info("Sent response via Composio: %s", response)
-    print("Composio response:", response)
-
-    return JSONResponse({"ok": True, "composio": response})
 
@@ -3,6 +3,8 @@
 from __future__ import annotations
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Any
 from dotenv import load_dotenv
 from supabase import create_client, Client
@@ -16,13 +18,37 @@ SUPABASE_SERVICE_KEY = os.getenv(
 )
 
 _table_name = "slack_accounts"
+# Only the columns the helpers below read; keeps PostgREST payloads small
+_SELECT_COLUMNS = "team_id,org_id,connected_account_id,auth_config_id,bot_user_id"
 
+# Rows per upsert request; keeps each PostgREST statement comfortably sized
+_UPSERT_BATCH_SIZE = 500
+# Batches upserted at once; each batch is its own PostgREST request
+_MAX_UPSERT_WORKERS = 4
 
+
+@lru_cache(maxsize=1)
 def get_supabase_client() -> Client:
-    """Create and return Supabase client."""
+    """Return the shared Supabase client, creating it on first use."""
     return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
 
+def invalidate_supabase_client() -> None:
+    """Drop the cached client so the next call builds a fresh one."""
+    get_supabase_client.cache_clear()
+
+
+def _account_details(row: dict[str, Any]) -> dict[str, Any]:
+    """Account fields of a slack_accounts row, with the defaults callers expect."""
+    get = row.get
+    return {
+        "org_id": get("org_id", ""),
+        "connected_account_id": get("connected_account_id", ""),
+        "auth_config_id": get("auth_config_id", ""),
+        "bot_user_id": get("bot_user_id"),
+    }
+
+
 def load_slack_mapping_from_supabase() -> dict[str, dict[str, Any]]:
     """
     Load all Slack account mappings from Supabase.
@@ -30,18 +56,12 @@ def load_slack_mapping_from_supabase() -> dict[str, dict[str, Any]]:
     """
     try:
         client = get_supabase_client()
-        response = client.table(_table_name).select("*").execute()
-        
-        mapping: dict[str, dict[str, Any]] = {}
-        for row in response.data:
-            team_id = row.get("team_id")
-            if team_id:
-                mapping[team_id] = {
-                    "org_id": row.get("org_id", ""),
-                    "connected_account_id": row.get("connected_account_id", ""),
-                    "auth_config_id": row.get("auth_config_id", ""),
-                    "bot_user_id": row.get("bot_user_id"),
-                }
+        response = client.table(_table_name).select(_SELECT_COLUMNS).execute()
+        mapping: dict[str, dict[str, Any]] = {
+            row["team_id"]: _account_details(row)
+            for row in response.data
+            if row.get("team_id")
+        }
         return mapping
     except Exception as e:
         raise RuntimeError(f"Failed to load Slack accounts from Supabase: {e}") from e
@@ -85,32 +105,45 @@ def bulk_upsert_slack_accounts(
     accounts: dict[str, dict[str, Any]]
 ) -> int:
     """
-    Bulk insert/update multiple Slack accounts.
+    Bulk insert/update multiple Slack accounts in batches of _UPSERT_BATCH_SIZE rows.
     Input format: {team_id: {org_id, connected_account_id, auth_config_id, bot_user_id}}
     Returns the number of accounts upserted.
     """
     try:
         client = get_supabase_client()
-        data_list = []
-        
-        for team_id, details in accounts.items():
-            record = {
+        data_list = [
+            {
                 "team_id": team_id,
                 "org_id": details.get("org_id", ""),
                 "connected_account_id": details.get("connected_account_id", ""),
                 "auth_config_id": details.get("auth_config_id", ""),
+                **({"bot_user_id": details["bot_user_id"]} if details.get("bot_user_id") else {}),
             }
-            if details.get("bot_user_id"):
-                record["bot_user_id"] = details["bot_user_id"]
-            data_list.append(record)
+            for team_id, details in accounts.items()
+        ]
         
         if not data_list:
             return 0
         
-        response = client.table(_table_name).upsert(
-            data_list,
-            on_conflict="team_id"
-        ).execute()
+        # One HTTP request per batch rather than per row; return=minimal means
+        # PostgREST sends no rows back for us to download and decode
+        def upsert_batch(batch: list[dict[str, Any]]) -> None:
+            client.table(_table_name).upsert(
+                batch,
+                on_conflict="team_id",
+                returning="minimal",
+            ).execute()
+
+        batches = [
+            data_list[start:start + _UPSERT_BATCH_SIZE]
+            for start in range(0, len(data_list), _UPSERT_BATCH_SIZE)
+        ]
+        if len(batches) == 1:
+            upsert_batch(batches[0])
+        else:
+            # team_ids are unique across batches, so they can land in any order
+            with ThreadPoolExecutor(max_workers=min(_MAX_UPSERT_WORKERS, len(batches))) as pool:
+                list(pool.map(upsert_batch, batches))
         
         return len(data_list)
     except Exception as e:
@@ -121,17 +154,20 @@ def get_slack_account(team_id: str) -> dict[str, Any] | None:
     """Get a single Slack account by team_id."""
     try:
         client = get_supabase_client()
-        response = client.table(_table_name).select("*").eq("team_id", team_id).execute()
+        # maybe_single() asks PostgREST for one object instead of an array
+        response = (
+            client.table(_table_name)
+            .select(_SELECT_COLUMNS)
+            .eq("team_id", team_id)
+            .limit(1)
+            .maybe_single()
+            .execute()
+        )
         
-        if response.data:
-            row = response.data[0]
-            return {
-                "team_id": row.get("team_id"),
-                "org_id": row.get("org_id", ""),
-                "connected_account_id": row.get("connected_account_id", ""),
-                "auth_config_id": row.get("auth_config_id", ""),
-                "bot_user_id": row.get("bot_user_id"),
-            }
+        # Some supabase-py versions return None rather than an empty response on no match
+        row = response.data if response is not None else None
+        if row:
+            return {"team_id": row.get("team_id"), **_account_details(row)}
         return None
     except Exception as e:
         raise RuntimeError(f"Failed to get Slack account from Supabase: {e}") from e
@@ -0,0 +1,40 @@
+"""Background-task and cross-worker dedupe helpers shared by the webhook apps."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Coroutine
+
+logger = logging.getLogger(__name__)
+
+# Strong references to in-flight background tasks so they are not garbage-collected
+_background_tasks: set[asyncio.Task] = set()
+
+
+def spawn(coro: Coroutine[Any, Any, None]) -> asyncio.Task:
+    """Schedule a coroutine in the background and keep a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def seen_in_redis(redis: Any, key: str, ttl_seconds: int) -> bool:
+    """
+    Claim `key` in Redis and report whether another worker already had it.
+    Returns False when redis is None or unreachable, leaving dedupe to the caller's
+    in-process cache.
+    """
+    if redis is None:
+        return False
+    try:
+        # SET NX only succeeds for the first worker to see this key
+        claimed = await redis.set(key, 1, nx=True, ex=ttl_seconds)
+        return not claimed
+    except Exception as e:
+        logger.warning("Redis dedupe check failed, using in-process cache only: %s", e)
+        return False
+
+
+__all__ = ["spawn", "seen_in_redis"]
@@ -36,18 +36,20 @@ async def handle_update(update: dict[str, Any]) -> None:
         # Call RAG Super Agent chat API
         reply = await get_rag_chat_response(text)
         logger.info("Reply: %s", reply)
-        send_telegram_message_via_composio(chat_id=chat_id, text=reply)
+        # The Composio SDK is synchronous; keep it off the event loop
+        await asyncio.to_thread(send_telegram_message_via_composio, chat_id=chat_id, text=reply)
     except Exception as exc:
         logger.exception("Error processing message: %s", exc)
         error_msg = "Sorry, I encountered an error processing your message. Please try again."
-        send_telegram_message_via_composio(chat_id=chat_id, text=error_msg)
+        await asyncio.to_thread(send_telegram_message_via_composio, chat_id=chat_id, text=error_msg)
 
 
 async def poll_loop() -> None:
     offset: int | None = None
     while True:
         try:
-            result = get_telegram_updates_via_composio(
+            result = await asyncio.to_thread(
+                get_telegram_updates_via_composio,
                 offset=offset,
                 timeout=30,
                 limit=20,
@@ -59,14 +61,25 @@ async def poll_loop() -> None:
 
             updates = result.get("data", {}).get("result", [])
             if not updates:
-                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+                # getUpdates already long-polled for `timeout` seconds; poll again straight away
                 continue
 
-            for update in updates:
-                await handle_update(update)
-                update_id = update.get("update_id")
-                if update_id is not None:
-                    offset = update_id + 1
+            # Handle the whole batch concurrently so replies overlap their RAG/Composio round-trips
+            outcomes = await asyncio.gather(
+                *(handle_update(update) for update in updates),
+                return_exceptions=True,
+            )
+            # handle_update logs its own errors; this catches a failed error-reply send
+            for update, outcome in zip(updates, outcomes):
+                if isinstance(outcome, Exception):
+                    logger.error("Failed to handle update %s: %s", update.get("update_id"), outcome)
+            # The next getUpdates(offset=...) acks everything below it, so one commit per batch
+            max_id = max(
+                (u["update_id"] for u in updates if u.get("update_id") is not None),
+                default=None,
+            )
+            if max_id is not None:
+                offset = max_id + 1
         except Exception as exc:  # pragma: no cover - safety loop
             logger.exception("Polling error: %s", exc)
             await asyncio.sleep(POLL_INTERVAL_SECONDS)